@@ -1,23 +1,31 @@
 import os
 import re
-import time
+import gzip
+import math
 import random
-from urllib.parse import urljoin
+import sqlite3
+import asyncio
+from hashlib import blake2b, sha256
+from collections import defaultdict
+from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
 
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from lxml import etree, html as lxml_html
 
 # Базовый домен, относительно которого строим абсолютные URL
 BASE = "https://ilibrary.ru"
 # Страница со списком авторов (на ней много ссылок вида /author/<slug>/index.html)
 AUTHORS_PAGE = f"{BASE}/author.html"
 
-# Куда сохранять скачанные страницы
+# Куда сохранять скачанные страницы (N.txt.gz — HTML как есть, сжатый gzip)
 OUT_DIR = "./task1/dump"
 # Файл, куда запишем подготовленный список ссылок
 URLS_TXT = "./task1/urls.txt"
 # Файл индекса: номер_файла -> URL
 INDEX_TXT = "./task1/index.txt"
+# Состояние обхода (список URL и что уже скачано) — чтобы повторный запуск продолжал с места остановки
+CRAWL_DB = "./task1/crawl.db"
 
 # Требование задания: скачать минимум 100 страниц
 MIN_PAGES_TO_DOWNLOAD = 100
@@ -28,10 +36,14 @@ TIMEOUT = 25
 # - случайная задержка между запросами (сек) — снижает риск блокировок и уважает нагрузку
 MIN_DELAY = 0.6
 MAX_DELAY = 1.6
+# - сколько запросов может "висеть" одновременно (пока один ждёт ответа, другие уже отправлены)
+CONCURRENCY = 32
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; StudyCrawler/1.0; +https://example.com/bot)"
 }
+# Имя робота, по которому ищем правила в robots.txt
+ROBOTS_AGENT = "StudyCrawler"
 
 # Ограничение на размер скачиваемой страницы (в байтах),
 # чтобы случайно не скачать что-то очень большое
@@ -41,68 +53,186 @@ MAX_BYTES = 5_000_000  # 5 MB
 # https://ilibrary.ru/text/475/p.1/index.html
 # Регулярка, описывающая "текстовую" страницу ilibrary:
 TEXT_PAGE_RE = re.compile(r"^https?://(?:www\.)?ilibrary\.ru/text/\d+/p\.\d+/index\.html$")
+# Страница автора: https://ilibrary.ru/author/<slug>/index.html
+AUTHOR_PAGE_RE = re.compile(r"^https?://(?:www\.)?ilibrary\.ru/author/[^/]+/index\.html$")
 
+# Отсев дублей среди скачанных страниц (одна глава по разным URL и т.п.):
+# - длина шингла в словах для SimHash
+SHINGLE_SIZE = 4
+# - страницы, SimHash которых отличается не более чем на столько бит, считаем почти-дублями
+SIMHASH_MAX_DISTANCE = 3
+# - слово для шинглов SimHash (буквы/цифры любого алфавита)
+WORD_RE = re.compile(r"\w+")
 
-def polite_sleep():
+# Фильтр уже встреченных URL (Bloom): сколько URL рассчитываем хранить
+# и допустимая доля ложных срабатываний ("видели", хотя не видели)
+SEEN_CAPACITY = 2_000_000
+SEEN_ERROR_RATE = 1e-4
+
+
+class HostLimiter:
     """
-    Делает случайную паузу между запросами.
-    Это простой, но эффективный способ:
-    - меньше нагрузка на сайт
-    - меньше риск банов/ограничений
+    "Вежливость" по хостам (как в Mercator):
+    - у каждого хоста своя очередь: запросы к нему разносятся во времени
+      на случайный интервал MIN_DELAY..MAX_DELAY (или на Crawl-delay из robots.txt,
+      если он больше), а запросы к разным хостам друг друга не ждут
+    - robots.txt каждого хоста скачиваем один раз и не ходим туда, куда он запрещает
     """
-    time.sleep(random.uniform(MIN_DELAY, MAX_DELAY))
 
+    def __init__(self, min_delay: float = MIN_DELAY, max_delay: float = MAX_DELAY):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        # хост -> момент времени (по часам event loop), раньше которого
+        # следующий запрос к нему отправлять нельзя
+        self._next = defaultdict(float)
+        # хост -> разобранный robots.txt
+        self._robots: dict[str, RobotFileParser] = {}
+        # чтобы robots.txt одного хоста качала только одна корутина
+        self._robots_locks = defaultdict(asyncio.Lock)
+
+    async def wait(self, host: str) -> None:
+        """Ждёт своей очереди на запрос к хосту host."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        delay = random.uniform(self.min_delay, self.max_delay)
+        rp = self._robots.get(host)
+        if rp is not None:
+            delay = max(delay, rp.crawl_delay(ROBOTS_AGENT) or 0)
+        # Занимаем ближайший свободный слот и сразу сдвигаем следующий —
+        # между чтением и записью нет await, поэтому гонки здесь нет
+        start = max(now, self._next[host])
+        self._next[host] = start + delay
+        await asyncio.sleep(start - now)
+
+    async def allowed(self, client: httpx.AsyncClient, url: str) -> bool:
+        """Разрешает ли robots.txt хоста скачивать url."""
+        parts = urlparse(url)
+        host = parts.netloc
+        async with self._robots_locks[host]:
+            if host not in self._robots:
+                self._robots[host] = await self._fetch_robots(client, parts.scheme, host)
+        return self._robots[host].can_fetch(ROBOTS_AGENT, url)
+
+    async def _fetch_robots(self, client: httpx.AsyncClient, scheme: str, host: str) -> RobotFileParser:
+        """
+        Скачивает и разбирает robots.txt (правила те же, что в RobotFileParser.read):
+        - 401/403 — всё запрещено
+        - другие ошибки / нет файла — всё разрешено
+        """
+        robots_url = f"{scheme}://{host}/robots.txt"
+        rp = RobotFileParser(robots_url)
+        await self.wait(host)
+        try:
+            resp = await client.get(robots_url)
+        except httpx.HTTPError as e:
+            print(f"[WARN] {robots_url} -> request error: {e}")
+            rp.allow_all = True
+            return rp
+
+        if resp.status_code in (401, 403):
+            rp.disallow_all = True
+        elif resp.status_code >= 400:
+            rp.allow_all = True
+        else:
+            rp.parse(resp.text.splitlines())
+        return rp
+
+
+HOST_LIMITER = HostLimiter()
+
+
+class BloomFilter:
+    """
+    Фильтр Блума для строк: множество "с потерями" фиксированного размера.
+    - ложных отрицаний нет: добавленная строка всегда "in"
+    - ложные срабатывания редки (примерно error_rate при заполнении до capacity)
+
+    Занимает ~2.4 байта на URL при error_rate=1e-4 против ~100 байт
+    на строку в обычном set().
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        # Классические формулы оптимального числа бит и хэш-функций
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Двойное хэширование: k позиций из одного 128-битного blake2b
+        digest = blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.num_hashes))
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
 
-def fetch_html(session: requests.Session, url: str) -> str | None:
+
+async def fetch_html(client: httpx.AsyncClient, url: str) -> str | None:
     """
     Скачивает HTML-страницу по URL и возвращает её как строку.
     Возвращает None, если:
+    - robots.txt запрещает эту страницу
     - запрос не удался
     - контент не text/html
     - контент слишком большой (> MAX_BYTES)
 
     - HTML НЕ очищаем от разметки — сохраняем "как есть"
     """
-    polite_sleep()
+    if not await HOST_LIMITER.allowed(client, url):
+        print(f"[SKIP] {url} -> disallowed by robots.txt")
+        return None
+    await HOST_LIMITER.wait(urlparse(url).netloc)
     # Выполняем HTTP GET к серверу
     try:
-        resp = session.get(url, timeout=TIMEOUT, allow_redirects=True, stream=True)
-    except requests.RequestException as e:
-        print(f"[SKIP] {url} -> request error: {e}")
-        return None
+        async with client.stream("GET", url) as resp:
+            ctype = (resp.headers.get("Content-Type") or "").lower()
+            if "text/html" not in ctype:
+                # иногда у простых страниц заголовок бывает странный, но чаще нормальный
+                # если не html — пропускаем
+                print(f"[SKIP] {url} -> not html (Content-Type={ctype})")
+                return None
 
-    ctype = (resp.headers.get("Content-Type") or "").lower()
-    if "text/html" not in ctype:
-        # иногда у простых страниц заголовок бывает странный, но чаще нормальный
-        # если не html — пропускаем
-        resp.close()
-        print(f"[SKIP] {url} -> not html (Content-Type={ctype})")
+            # Скачиваем контент "потоком",
+            # чтобы можно было оборвать скачивание при превышении MAX_BYTES
+            chunks = []
+            total = 0
+            async for chunk in resp.aiter_bytes(8192):
+                total += len(chunk)
+                if total > MAX_BYTES:
+                    print(f"[SKIP] {url} -> too large (> {MAX_BYTES} bytes)")
+                    return None
+                chunks.append(chunk)
+            encoding = resp.charset_encoding or "utf-8"
+    except httpx.HTTPError as e:
+        print(f"[SKIP] {url} -> request error: {e}")
         return None
 
-    # Скачиваем контент "потоком" (stream=True),
-    # чтобы можно было оборвать скачивание при превышении MAX_BYTES
-    chunks = []
-    total = 0
-    try:
-        for chunk in resp.iter_content(chunk_size=8192):
-            if not chunk:
-                continue
-            total += len(chunk)
-            if total > MAX_BYTES:
-                print(f"[SKIP] {url} -> too large (> {MAX_BYTES} bytes)")
-                return None
-            chunks.append(chunk)
-    finally:
-        resp.close()
-
     raw = b"".join(chunks)
-    encoding = resp.encoding or "utf-8"
     try:
         return raw.decode(encoding, errors="replace")
     except Exception:
         return raw.decode("utf-8", errors="replace")
 
 
+async def fetch_many(client: httpx.AsyncClient, urls: list[str]) -> list[str | None]:
+    """
+    Скачивает несколько страниц конкурентно (не более CONCURRENCY одновременно).
+    Результаты возвращаются в том же порядке, что и urls.
+    """
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def bounded(url: str) -> str | None:
+        async with sem:
+            return await fetch_html(client, url)
+
+    return await asyncio.gather(*(bounded(u) for u in urls))
+
+
 def extract_links(html: str, base_url: str) -> list[str]:
     """
     Парсит HTML и вытаскивает все ссылки <a href="...">,
@@ -110,19 +240,21 @@ def extract_links(html: str, base_url: str) -> list[str]:
 
     base_url нужен, чтобы urljoin корректно превратил относительные ссылки
     (например /author/...) в абсолютные (https://ilibrary.ru/author/...)
+
+    Разбираем напрямую через lxml: нам нужны только значения href,
+    поэтому дерево объектов BeautifulSoup строить незачем.
+    Если lxml не может разобрать страницу (строка с XML-декларацией кодировки,
+    документ без элементов) — возвращаем пустой список, обход продолжается.
     """
-    soup = BeautifulSoup(html, "lxml")
-    out = []
-    for a in soup.find_all("a", href=True):
-        href = a["href"].strip()
-        if not href:
-            continue
-        abs_url = urljoin(base_url, href)
-        out.append(abs_url)
-    return out
-
-
-def get_author_pages(session: requests.Session) -> list[str]:
+    try:
+        doc = lxml_html.fromstring(html)
+    except (ValueError, etree.ParserError) as e:
+        print(f"[SKIP] {base_url} -> cannot parse html: {e}")
+        return []
+    return [urljoin(base_url, href.strip()) for href in doc.xpath("//a/@href") if href.strip()]
+
+
+async def get_author_pages(client: httpx.AsyncClient) -> list[str]:
     """
     Шаг 1 "подготовки списка страниц":
     1) Скачиваем AUTHORS_PAGE (/author.html)
@@ -131,7 +263,7 @@ def get_author_pages(session: requests.Session) -> list[str]:
 
     Возвращаем список таких страниц (уникальный, с сохранением порядка).
     """
-    html = fetch_html(session, AUTHORS_PAGE)
+    html = await fetch_html(client, AUTHORS_PAGE)
     if not html:
         raise RuntimeError("Не удалось скачать страницу author.html")
 
@@ -141,7 +273,7 @@ def get_author_pages(session: requests.Session) -> list[str]:
     for u in links:
         # Фильтруем на страницы авторов
         # Обычно: https://ilibrary.ru/author/<slug>/index.html
-        if re.match(r"^https?://(?:www\.)?ilibrary\.ru/author/[^/]+/index\.html$", u):
+        if AUTHOR_PAGE_RE.match(u):
             author_pages.append(u)
 
     # Уникализация с сохранением порядка
@@ -169,7 +301,7 @@ def author_to_all_works_url(author_index_url: str) -> str:
     return author_index_url.replace("/index.html", "/l.all/index.html")
 
 
-def collect_text_page_urls(session: requests.Session, limit: int = 600) -> list[str]:
+async def collect_text_page_urls(client: httpx.AsyncClient, limit: int = 600) -> list[str]:
     """
     Шаг 2 "подготовки списка страниц":
     - Получаем список авторов
@@ -179,117 +311,291 @@ def collect_text_page_urls(session: requests.Session, limit: int = 600) -> list[
 
     limit — сколько ссылок собрать с запасом (лучше 1000+),
     потому что часть ссылок может не скачаться/быть короткой и т.д.
+
+    Страницы авторов качаются пачками по CONCURRENCY штук: внутри пачки —
+    конкурентно, а между пачками проверяем, не набрали ли уже limit.
     """
-    author_pages = get_author_pages(session)
+    author_pages = await get_author_pages(client)
     print(f"[INFO] authors found: {len(author_pages)}")
 
     collected = []
-    seen = set()
+    seen = BloomFilter(SEEN_CAPACITY, SEEN_ERROR_RATE)
 
-    for i, author_url in enumerate(author_pages, start=1):
+    for start in range(0, len(author_pages), CONCURRENCY):
         if len(collected) >= limit:
             break
 
-        all_works_url = author_to_all_works_url(author_url)
-        html = fetch_html(session, all_works_url)
-        if not html:
-            continue
+        batch = [author_to_all_works_url(u) for u in author_pages[start:start + CONCURRENCY]]
+        pages = await fetch_many(client, batch)
 
-        links = extract_links(html, all_works_url)
+        for all_works_url, html in zip(batch, pages):
+            if not html:
+                continue
+
+            links = extract_links(html, all_works_url)
 
-        # В l.all обычно ссылки идут на p.1 (а иногда и на конкретные p.N)
-        for u in links:
-            if TEXT_PAGE_RE.match(u):
-                if u not in seen:
-                    seen.add(u)
-                    collected.append(u)
-                    if len(collected) >= limit:
-                        break
+            # В l.all обычно ссылки идут на p.1 (а иногда и на конкретные p.N)
+            for u in links:
+                if TEXT_PAGE_RE.match(u):
+                    if u not in seen:
+                        seen.add(u)
+                        collected.append(u)
+                        if len(collected) >= limit:
+                            break
 
-        # Просто лог прогресса: каждые 10 авторов печатаем статистику по собранным авторам
-        if i % 10 == 0:
-            print(f"[INFO] processed authors: {i}, collected urls: {len(collected)}")
+            if len(collected) >= limit:
+                break
+
+        # Просто лог прогресса: после каждой пачки печатаем статистику по собранным авторам
+        processed = min(start + CONCURRENCY, len(author_pages))
+        print(f"[INFO] processed authors: {processed}, collected urls: {len(collected)}")
 
     return collected
 
 
+def simhash(text: str) -> int:
+    """
+    64-битный SimHash текста:
+    - режем текст на шинглы по SHINGLE_SIZE слов
+    - хэшируем каждый шингл (blake2b, 64 бита)
+    - бит результата = 1, если у большинства шинглов этот бит равен 1
+
+    У похожих текстов SimHash отличается в небольшом числе бит.
+    """
+    words = WORD_RE.findall(text.lower())
+    weights = [0] * 64
+    for i in range(max(len(words) - SHINGLE_SIZE + 1, 1)):
+        shingle = " ".join(words[i:i + SHINGLE_SIZE]).encode("utf-8")
+        h = int.from_bytes(blake2b(shingle, digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+class ContentDeduplicator:
+    """
+    Помнит содержимое уже сохранённых страниц:
+    - точные дубли ловим по хэшу HTML
+    - почти-дубли — по расстоянию Хэмминга между SimHash видимого текста
+    """
+
+    def __init__(self, max_distance: int = SIMHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.exact = set()
+        self.simhashes = []
+
+    def is_duplicate(self, html: str) -> bool:
+        """True, если страница уже встречалась; иначе запоминаем её и возвращаем False."""
+        digest = blake2b(html.encode("utf-8"), digest_size=16).digest()
+        if digest in self.exact:
+            return True
+
+        try:
+            text = lxml_html.fromstring(html).text_content()
+        except (ValueError, etree.ParserError):
+            # lxml не разбирает строку с XML-декларацией кодировки или документ
+            # без элементов — такую страницу сравниваем только по точному хэшу
+            text = None
+
+        if text is not None:
+            sh = simhash(text)
+            if any((sh ^ other).bit_count() <= self.max_distance for other in self.simhashes):
+                return True
+            self.simhashes.append(sh)
+
+        self.exact.add(digest)
+        return False
+
+
+def open_crawl_db(path: str) -> sqlite3.Connection:
+    """
+    Открывает (создаёт) базу состояния обхода:
+    - frontier(url, priority) — подготовленный список страниц в исходном порядке
+    - visited(url, sha256, saved_as) — уже скачанные страницы;
+      saved_as — номер файла в dump/ или NULL, если страницу скачали, но не сохранили
+      (дубль, слишком короткая)
+    """
+    db = sqlite3.connect(path)
+    # WAL + synchronous=NORMAL: быстрые коммиты, при сбое теряется максимум последняя пачка
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY, priority INTEGER)")
+    db.execute("CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY, sha256 TEXT, saved_as INTEGER)")
+    db.commit()
+    return db
+
+
+def load_frontier(db: sqlite3.Connection) -> list[str]:
+    """Список страниц, подготовленный в прошлый запуск (пустой, если его ещё нет)."""
+    return [url for (url,) in db.execute("SELECT url FROM frontier ORDER BY priority")]
+
+
+def save_frontier(db: sqlite3.Connection, urls: list[str]) -> None:
+    db.executemany(
+        "INSERT OR IGNORE INTO frontier (url, priority) VALUES (?, ?)",
+        ((u, i) for i, u in enumerate(urls)),
+    )
+    db.commit()
+
+
+def mark_visited(db: sqlite3.Connection, url: str, html: str, saved_as: int | None) -> None:
+    digest = sha256(html.encode("utf-8")).hexdigest()
+    db.execute(
+        "INSERT OR IGNORE INTO visited (url, sha256, saved_as) VALUES (?, ?, ?)",
+        (url, digest, saved_as),
+    )
+
+
 def save_text(path: str, content: str) -> None:
     """
-    Сохраняет строку content в файл (UTF-8).
+    Сохраняет строку content в gzip-файл (UTF-8 внутри).
+    Текст HTML жмётся в разы, поэтому дамп меньше и быстрее читается в task2/task4.
+    compresslevel=3 — почти та же степень сжатия, что и максимум, но заметно быстрее.
     errors="replace" — чтобы даже при странных символах файл всё равно сохранился.
     """
-    with open(path, "w", encoding="utf-8", errors="replace") as f:
+    with gzip.open(path, "wt", encoding="utf-8", errors="replace", compresslevel=3) as f:
         f.write(content)
 
 
-def download_pages(session: requests.Session, urls: list[str], need: int) -> int:
+async def download_pages(client: httpx.AsyncClient, db: sqlite3.Connection, urls: list[str], need: int) -> int:
     """
     Шаг 3 задания: скачать страницы по заранее подготовленному списку urls.
-    - сохраняем каждую страницу в отдельный файл: 1.txt, 2.txt, ...
+    - сохраняем каждую страницу в отдельный файл: 1.txt.gz, 2.txt.gz, ...
     - создаём index.txt: номер -> url
+    - дубли и почти-дубли уже сохранённых страниц пропускаем
 
     need — сколько реально нужно сохранить (минимум 100 по заданию)
+
+    Качаем пачками: в каждой пачке столько URL, сколько ещё не хватает
+    (но не больше CONCURRENCY), поэтому лишних запросов почти нет,
+    а нумерация файлов идёт в порядке списка urls.
+
+    Всё скачанное отмечается в db (таблица visited): при повторном запуске
+    эти URL не запрашиваются снова, а нумерация продолжается с MAX(saved_as) + 1.
+    Если файла сохранённой страницы в dump/ уже нет, страница скачивается заново.
     """
     os.makedirs(OUT_DIR, exist_ok=True)
-    index_lines = []
-    saved = 0
+    dedup = ContentDeduplicator()
+
+    # Забываем сохранённые страницы, чьих файлов больше нет (dump/ удалили или почистили),
+    # иначе они посчитались бы скачанными и попали бы в index.txt
+    missing = [
+        (url,)
+        for num, url in db.execute("SELECT saved_as, url FROM visited WHERE saved_as IS NOT NULL")
+        if not os.path.exists(os.path.join(OUT_DIR, f"{num}.txt.gz"))
+    ]
+    if missing:
+        print(f"[INFO] resume: {len(missing)} saved pages are missing in {OUT_DIR}, downloading them again")
+        db.executemany("DELETE FROM visited WHERE url = ?", missing)
+        db.commit()
+
+    visited = {url for (url,) in db.execute("SELECT url FROM visited")}
+    saved_rows = db.execute(
+        "SELECT saved_as, url FROM visited WHERE saved_as IS NOT NULL ORDER BY saved_as"
+    ).fetchall()
+    saved = len(saved_rows)
+    next_num = saved_rows[-1][0] + 1 if saved_rows else 1
+    if saved:
+        print(f"[INFO] resume: already saved {saved} pages")
+
+    # Уже сохранённые страницы нужны отсеву дублей, чтобы не сохранить их повторно
+    for num, _ in saved_rows:
+        path = os.path.join(OUT_DIR, f"{num}.txt.gz")
+        with gzip.open(path, "rt", encoding="utf-8", errors="replace") as f:
+            dedup.is_duplicate(f.read())
+
+    pending = [u for u in urls if u not in visited]
+    pos = 0
+
+    while saved < need and pos < len(pending):
+        batch = pending[pos:pos + min(need - saved, CONCURRENCY)]
+        pos += len(batch)
+        pages = await fetch_many(client, batch)
+
+        for url, html in zip(batch, pages):
+            # Неудачные загрузки в visited не пишем — в следующий раз попробуем ещё раз
+            if not html:
+                continue
 
-    for url in urls:
-        if saved >= need:
-            break
+            # Мини-проверка, что страница не совсем пустая:
+            # (иногда могут быть страницы-заглушки или очень короткие)
+            if len(html) < 1000:
+                print(f"[SKIP] {url} -> too small html")
+                mark_visited(db, url, html, None)
+                continue
+
+            if dedup.is_duplicate(html):
+                print(f"[SKIP] {url} -> duplicate content")
+                mark_visited(db, url, html, None)
+                continue
 
-        html = fetch_html(session, url)
-        if not html:
-            continue
-
-        # Мини-проверка, что страница не совсем пустая:
-        # (иногда могут быть страницы-заглушки или очень короткие)
-        if len(html) < 1000:
-            print(f"[SKIP] {url} -> too small html")
-            continue
-
-        # Нумерация файлов начинается с 1
-        num = saved + 1
-        out_file = os.path.join(OUT_DIR, f"{num}.txt")
-        # Сохраняем HTML "как есть" (НЕ очищаем от разметки)
-        save_text(out_file, html)
-        # Пишем строку индекса в финальный файл: "номер страницы из выкачки и url"
-        index_lines.append(f"{num}\t{url}")
-        saved += 1
-        print(f"[OK] {num}: {url}")
-
-    # После скачивания формируем index.txt
-    # index.txt
+            num = next_num
+            out_file = os.path.join(OUT_DIR, f"{num}.txt.gz")
+            # Сохраняем HTML "как есть" (НЕ очищаем от разметки)
+            save_text(out_file, html)
+            mark_visited(db, url, html, num)
+            next_num += 1
+            saved += 1
+            print(f"[OK] {num}: {url}")
+
+        # Фиксируем прогресс после каждой пачки
+        db.commit()
+
+    # После скачивания формируем index.txt по всем сохранённым страницам
+    # (включая скачанные в прошлые запуски): "номер страницы из выкачки и url"
+    index_lines = [
+        f"{num}\t{url}"
+        for num, url in db.execute(
+            "SELECT saved_as, url FROM visited WHERE saved_as IS NOT NULL ORDER BY saved_as"
+        )
+    ]
     with open(INDEX_TXT, "w", encoding="utf-8") as f:
         f.write("\n".join(index_lines) + ("\n" if index_lines else ""))
 
     return saved
 
 
-def main():
-    session = requests.Session()
-    session.headers.update(HEADERS)
-
-    # 1) Собираем "предварительно подготовленный список"
-    # Берём с запасом, чтобы точно скачать 100 после пропусков
-    urls = collect_text_page_urls(session, limit=1200)
-
-    # Записываем urls.txt
-    with open(URLS_TXT, "w", encoding="utf-8") as f:
-        for u in urls:
-            f.write(u + "\n")
-
-    print(f"[INFO] urls saved to {URLS_TXT}: {len(urls)}")
-
-    # 2) Качаем минимум 100 страниц
-    saved = download_pages(session, urls, MIN_PAGES_TO_DOWNLOAD)
+async def main():
+    # Один клиент на весь запуск: соединение с TLS-сессией переиспользуется,
+    # а по HTTP/2 запросы к одному хосту идут параллельными потоками в одном соединении
+    limits = httpx.Limits(max_keepalive_connections=32, keepalive_expiry=60)
+
+    db = open_crawl_db(CRAWL_DB)
+    async with httpx.AsyncClient(
+        http2=True,
+        headers=HEADERS,
+        timeout=httpx.Timeout(TIMEOUT),
+        limits=limits,
+        follow_redirects=True,
+    ) as client:
+        # 1) Собираем "предварительно подготовленный список"
+        # (если он уже собран в прошлый запуск — берём из базы, по сети не ходим)
+        urls = load_frontier(db)
+        if urls:
+            print(f"[INFO] resume: urls loaded from {CRAWL_DB}: {len(urls)}")
+        else:
+            # Берём с запасом, чтобы точно скачать 100 после пропусков
+            urls = await collect_text_page_urls(client, limit=1200)
+            save_frontier(db, urls)
+
+        # Записываем urls.txt
+        with open(URLS_TXT, "w", encoding="utf-8") as f:
+            for u in urls:
+                f.write(u + "\n")
+
+        print(f"[INFO] urls saved to {URLS_TXT}: {len(urls)}")
+
+        # 2) Качаем минимум 100 страниц
+        saved = await download_pages(client, db, urls, MIN_PAGES_TO_DOWNLOAD)
+    db.close()
 
     if saved < MIN_PAGES_TO_DOWNLOAD:
         print(f"[DONE] скачано {saved}, нужно {MIN_PAGES_TO_DOWNLOAD}. "
-              f"Попробуйте увеличить limit в collect_text_page_urls() или повторить запуск.")
+              f"Повторите запуск (уже скачанное не будет качаться заново) или увеличьте limit "
+              f"в collect_text_page_urls() и удалите {CRAWL_DB}, чтобы собрать список заново.")
     else:
         print(f"[DONE] скачано {saved} страниц. HTML сохранён как есть в ./{OUT_DIR}, индекс: {INDEX_TXT}")
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
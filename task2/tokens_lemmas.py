@@ -1,9 +1,16 @@
 import os
 import re
+import sys
 import glob
+import gzip
+from html import unescape
 from collections import defaultdict, Counter
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
 
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 import pymorphy3
 
 
@@ -20,14 +27,16 @@ LEMMAS_DIR = os.path.join(BASE_DIR, "lemmas")
 
 
 # Токенизация и фильтры
-# Русские слова; допускаем один дефис внутри (например "северо-запад")
-WORD_RE = re.compile(r"[а-яё]+(?:-[а-яё]+)?", re.IGNORECASE)
+# Русские слова; допускаем один дефис внутри (например "северо-запад").
+# Оба регистра перечислены явно: с re.IGNORECASE поиск заметно медленнее
+WORD_RE = re.compile(r"[а-яёА-ЯЁ]+(?:-[а-яёА-ЯЁ]+)?")
 
 # Минимальная длина токена, чтобы отсеять короткие служебные обломки
 MIN_LEN = 3
 
 # Нормализация дефисных клитик: "тут-то" -> "тут", "смотри-ка" -> "смотри"
-CLITIC_RE = re.compile(r"^(?P<stem>[а-яё]+)-(то|де|ка|т)$", re.IGNORECASE)
+# (WORD_RE допускает только один дефис, поэтому достаточно проверить окончание)
+CLITICS = ("-то", "-де", "-ка", "-т")
 
 # Части речи, которые выкидываем как "неинтересные" для словаря
 # PREP предлог, CONJ союз, PRCL частица, INTJ междометие, NUMR числительное, NPRO местоимение
@@ -39,53 +48,111 @@ MIN_SCORE = 0.20
 # Более строгий порог для слов, встретившихся 1 раз в данном файле
 HAPAX_SCORE = 0.35
 
+# Теги, текст внутри которых не виден пользователю
+SKIP_TAGS = {"script", "style", "noscript"}
 
-def html_to_text(html: str) -> str:
+# Все дампы — страницы одного сайта (ilibrary.ru) с однотипной разметкой,
+# поэтому по умолчанию текст достаём регулярками, без разбора HTML.
+# False — использовать разбор HTML через selectolax (медленнее, но надёжнее)
+FAST_HTML_TO_TEXT = True
+
+# Комментарии и невидимые блоки целиком, затем любые теги
+HIDDEN_BLOCK_RE = re.compile(
+    r"<!--.*?-->|<(script|style|noscript)\b.*?</\1\s*>",
+    re.DOTALL | re.IGNORECASE,
+)
+TAG_RE = re.compile(r"<[^>]+>")
+SPACE_RE = re.compile(r"\s+")
+
+# Морфоанализатор: загрузка словарей дорогая, поэтому создаём его
+# один раз на процесс (см. init_worker) и переиспользуем для всех файлов.
+# pymorphy3[fast] ставит C-реализацию словарей (DAWG2) — разбор в разы быстрее.
+# Сам анализатор не меняем: запросы в task3/task5 лемматизируются pymorphy3,
+# и леммы в индексе должны с ними совпадать
+MORPH = None
+
+
+def html_to_text(raw: bytes) -> str:
     """
-    Достаём видимый текст из HTML:
+    Достаём видимый текст из HTML (на вход — содержимое файла в байтах, UTF-8):
+    - вырезаем комментарии и script/style/noscript вместе с содержимым
+    - заменяем оставшиеся теги пробелами
+    - раскрываем HTML-сущности (&nbsp;, &laquo; ...) и схлопываем пробелы
+    """
+    if not FAST_HTML_TO_TEXT:
+        # selectolax принимает байты сам — лишнюю декодированную копию не создаём
+        return html_to_text_parsed(raw)
+
+    html = raw.decode("utf-8", errors="replace")
+    text = HIDDEN_BLOCK_RE.sub(" ", html)
+    text = TAG_RE.sub(" ", text)
+    text = unescape(text)
+    return SPACE_RE.sub(" ", text).strip()
+
+
+def html_to_text_parsed(html: str | bytes) -> str:
+    """
+    Достаём видимый текст из HTML через настоящий HTML-парсер (selectolax/lexbor, на C):
     - парсим HTML
     - удаляем script/style/noscript
     - возвращаем "плоский" текст
     """
-    soup = BeautifulSoup(html, "lxml")
-    for tag in soup(["script", "style", "noscript"]):
-        tag.decompose()
-    return soup.get_text(" ", strip=True)
+    tree = LexborHTMLParser(html)
+    for node in tree.css(",".join(SKIP_TAGS)):
+        node.decompose()
+    if tree.root is None:
+        return ""
+    return tree.root.text(separator=" ", strip=True)
 
 
 def normalize_token(tok: str) -> str:
     """
-    Нормализация токена:
-    - нижний регистр
+    Нормализация токена (на вход — совпадение WORD_RE в нижнем регистре):
     - отрезаем дефисные клитики (тут-то -> тут)
     """
-    tok = tok.lower()
-    m = CLITIC_RE.match(tok)
-    if m:
-        return m.group("stem")
+    if tok.endswith(CLITICS):
+        return tok.rsplit("-", 1)[0]
     return tok
 
 
-def is_clean_token(tok: str) -> bool:
+@lru_cache(maxsize=200_000)
+def parse_best(tok: str):
+    """
+    Самый вероятный морфоразбор токена.
+    Кэшируем: одни и те же слова повторяются из файла в файл,
+    а разбор — самая дорогая операция в обработке.
     """
-    Грубый фильтр токена до морфологии:
-    - длина >= MIN_LEN
-    - только кириллица, допускаем один дефис внутри
+    return MORPH.parse(tok)[0]
+
+
+def list_dump_files(dump_dir: str) -> list[str]:
     """
-    tok = tok.lower()
-    if len(tok) < MIN_LEN:
-        return False
-    return re.fullmatch(r"[а-яё]+(?:-[а-яё]+)?", tok) is not None
+    Файлы выкачки из task1: N.txt.gz (сжатые) или N.txt (старый формат).
+    Если для одного N есть оба — берём .gz.
+    """
+    by_name = {}
+    for pattern in ("*.txt", "*.txt.gz"):
+        for path in glob.glob(os.path.join(dump_dir, pattern)):
+            by_name[os.path.basename(path).removesuffix(".gz")] = path
+    return sorted(by_name.values())
+
+
+def read_dump(path: str) -> bytes:
+    """Байты HTML из файла выкачки (.gz распаковываем)."""
+    raw = Path(path).read_bytes()
+    if path.endswith(".gz"):
+        return gzip.decompress(raw)
+    return raw
 
 
 def file_id_from_path(path: str) -> str:
-    stem = os.path.splitext(os.path.basename(path))[0]
+    stem = os.path.splitext(os.path.basename(path).removesuffix(".gz"))[0]
     if re.fullmatch(r"\d+", stem):
         return stem
     return stem
 
 
-def process_one_file(morph: pymorphy3.MorphAnalyzer, path: str):
+def process_one_file(path: str):
     """
     Обрабатываем один файл:
     1) вытаскиваем текст из HTML
@@ -93,23 +160,30 @@ def process_one_file(morph: pymorphy3.MorphAnalyzer, path: str):
     3) фильтруем по морфологии/уверенности
     4) строим отображение лемма -> токены
     """
-    with open(path, "r", encoding="utf-8", errors="replace") as f:
-        html = f.read()
-
-    text = html_to_text(html)
-
-    # Частоты считаем в рамках одного файла, чтобы hapax-фильтр был "по файлу"
+    # Читаем байты одним вызовом, без построчного декодирования TextIOWrapper
+    text = html_to_text(read_dump(path))
+
+    # Частоты считаем в рамках одного файла, чтобы hapax-фильтр был "по файлу".
+    # Сначала считаем словоформы целиком на стороне C: findall + map(str.lower) + Counter
+    # (копию всего текста в нижнем регистре не делаем — приводим только найденные токены).
+    # Дальше Python-код работает лишь с уникальными формами, которых в разы меньше,
+    # чем вхождений. Совпадения WORD_RE уже состоят только из кириллицы (с одним дефисом),
+    # так что остаётся отрезать клитику (бывает только у слов с дефисом) и проверить длину
+    forms = Counter(map(str.lower, WORD_RE.findall(text)))
     freq = Counter()
-
-    for m in WORD_RE.finditer(text.lower()):
-        tok = normalize_token(m.group(0))
-        if is_clean_token(tok):
-            freq[tok] += 1
-
-    tokens = set()
+    for tok, n in forms.items():
+        if "-" in tok:
+            tok = normalize_token(tok)
+        if len(tok) >= MIN_LEN:
+            freq[tok] += n
+
+    # Ключи freq уникальны, поэтому токены собираем в список, а лемму
+    # каждого прошедшего токена кладём в lemma_to_tokens сразу, в том же проходе
+    tokens = []
+    lemma_to_tokens = defaultdict(set)
 
     for tok, count_in_file in freq.items():
-        p = morph.parse(tok)[0]  # самый вероятный разбор
+        p = parse_best(tok)  # самый вероятный разбор
 
         # Неизвестные слова (часто мусор/обрывки)
         if hasattr(p, "is_known") and not p.is_known:
@@ -127,15 +201,11 @@ def process_one_file(morph: pymorphy3.MorphAnalyzer, path: str):
         if count_in_file == 1 and p.score < HAPAX_SCORE:
             continue
 
-        tokens.add(tok)
+        tokens.append(tok)
+        lemma_to_tokens[p.normal_form].add(tok)
 
     tokens_sorted = sorted(tokens)
 
-    lemma_to_tokens = defaultdict(set)
-    for tok in tokens_sorted:
-        lemma = morph.parse(tok)[0].normal_form
-        lemma_to_tokens[lemma].add(tok)
-
     return tokens_sorted, lemma_to_tokens
 
 
@@ -148,39 +218,67 @@ def write_outputs(out_id: str, tokens_sorted, lemma_to_tokens):
     tokens_path = os.path.join(TOKENS_DIR, f"tokens{out_id}.txt")
     lemmas_path = os.path.join(LEMMAS_DIR, f"lemmas{out_id}.txt")
 
+    # Каждый файл пишем одним вызовом write: строки собираем заранее через join
     # tokens
-    with open(tokens_path, "w", encoding="utf-8") as f:
-        for t in tokens_sorted:
-            f.write(t + "\n")
+    with open(tokens_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.write("".join(t + "\n" for t in tokens_sorted))
 
     # lemmas
-    with open(lemmas_path, "w", encoding="utf-8") as f:
-        for lemma in sorted(lemma_to_tokens.keys()):
-            toks = sorted(lemma_to_tokens[lemma])
-            f.write(lemma + " " + " ".join(toks) + "\n")
+    lines = [
+        f"{lemma} {' '.join(sorted(lemma_to_tokens[lemma]))}\n"
+        for lemma in sorted(lemma_to_tokens)
+    ]
+    with open(lemmas_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.write("".join(lines))
 
     print(f"[OK] {out_id}: tokens={len(tokens_sorted)} -> {tokens_path}")
     print(f"[OK] {out_id}: lemmas={len(lemma_to_tokens)} -> {lemmas_path}")
 
 
+def init_worker():
+    """Инициализация процесса-воркера: загружаем морфоанализатор один раз."""
+    global MORPH
+    if MORPH is None:
+        MORPH = pymorphy3.MorphAnalyzer()
+
+
+def handle_file(path: str) -> str:
+    """
+    Полная обработка одного файла в воркере: разбор + запись результатов.
+    Файлы независимы друг от друга, поэтому общего состояния и блокировок нет.
+    """
+    out_id = file_id_from_path(path)
+    tokens_sorted, lemma_to_tokens = process_one_file(path)
+    write_outputs(out_id, tokens_sorted, lemma_to_tokens)
+    return out_id
+
+
 def main():
     # Создаём папки для результатов, если их нет
     os.makedirs(TOKENS_DIR, exist_ok=True)
     os.makedirs(LEMMAS_DIR, exist_ok=True)
 
-    morph = pymorphy3.MorphAnalyzer()
-
-    files = sorted(glob.glob(os.path.join(DUMP_DIR, "*.txt")))
+    files = list_dump_files(DUMP_DIR)
     if not files:
         raise SystemExit(
             f"Не найдено файлов в папке '{DUMP_DIR}'. "
-            f"Ожидаются {DUMP_DIR}/1.txt, {DUMP_DIR}/2.txt, ..."
+            f"Ожидаются {DUMP_DIR}/1.txt.gz, {DUMP_DIR}/2.txt.gz, ... (или 1.txt, 2.txt, ...)"
         )
 
-    for path in files:
-        out_id = file_id_from_path(path)
-        tokens_sorted, lemma_to_tokens = process_one_file(morph, path)
-        write_outputs(out_id, tokens_sorted, lemma_to_tokens)
+    # На Linux воркеры создаются через fork: словари загружаем один раз
+    # в родительском процессе, и воркеры получают уже готовый MORPH (страницы памяти
+    # общие, копируются только при записи). Где fork недоступен или небезопасен
+    # (Windows, macOS), родитель словари не грузит — каждый воркер загрузит их сам в init_worker
+    ctx = None
+    if sys.platform.startswith("linux"):
+        ctx = mp.get_context("fork")
+        init_worker()
+
+    # Обработка упирается в CPU (морфология + регулярки + разбор HTML),
+    # поэтому раскладываем файлы по процессам — по одному на ядро
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=ctx, initializer=init_worker) as ex:
+        for _ in ex.map(handle_file, files):
+            pass
 
 
 if __name__ == "__main__":
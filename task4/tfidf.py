@@ -1,10 +1,12 @@
 import os
 import re
 import glob
+import gzip
 import math
 from collections import Counter, defaultdict
+from pathlib import Path
 
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 import pymorphy3
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -21,6 +23,9 @@ WORD_RE = re.compile(r"[а-яё]+(?:-[а-яё]+)?", re.IGNORECASE)
 # Минимальная длина токена
 MIN_LEN = 3
 
+# Токен целиком: только кириллица, допускаем один дефис
+CLEAN_TOKEN_RE = re.compile(r"[а-яё]+(?:-[а-яё]+)?")
+
 # Нормализация дефисных клитик: "тут-то" -> "тут"
 CLITIC_RE = re.compile(r"^(?P<stem>[а-яё]+)-(то|де|ка|т)$", re.IGNORECASE)
 
@@ -32,12 +37,14 @@ MIN_SCORE = 0.20
 HAPAX_SCORE = 0.35
 
 
-def html_to_text(html: str) -> str:
-    """Вытаскиваем видимый текст из HTML."""
-    soup = BeautifulSoup(html, "lxml")
-    for tag in soup(["script", "style", "noscript"]):
-        tag.decompose()
-    return soup.get_text(" ", strip=True)
+def html_to_text(html: str | bytes) -> str:
+    """Вытаскиваем видимый текст из HTML (selectolax — парсер на C)."""
+    tree = LexborHTMLParser(html)
+    for node in tree.css("script,style,noscript"):
+        node.decompose()
+    if tree.root is None:
+        return ""
+    return tree.root.text(separator=" ", strip=True)
 
 
 def normalize_token(tok: str) -> str:
@@ -54,14 +61,34 @@ def is_clean_token(tok: str) -> bool:
     tok = tok.lower()
     if len(tok) < MIN_LEN:
         return False
-    return re.fullmatch(r"[а-яё]+(?:-[а-яё]+)?", tok) is not None
+    return CLEAN_TOKEN_RE.fullmatch(tok) is not None
+
+
+def list_dump_files(dump_dir: str) -> list[str]:
+    """
+    Файлы выкачки из task1: N.txt.gz (сжатые) или N.txt (старый формат).
+    Если для одного N есть оба — берём .gz.
+    """
+    by_name = {}
+    for pattern in ("*.txt", "*.txt.gz"):
+        for path in glob.glob(os.path.join(dump_dir, pattern)):
+            by_name[os.path.basename(path).removesuffix(".gz")] = path
+    return sorted(by_name.values())
+
+
+def read_dump(path: str) -> bytes:
+    """Байты HTML из файла выкачки (.gz распаковываем)."""
+    raw = Path(path).read_bytes()
+    if path.endswith(".gz"):
+        return gzip.decompress(raw)
+    return raw
 
 
 def file_id_from_path(path: str) -> int:
-    """Берём номер документа из имени файла dump/N.txt."""
-    stem = os.path.splitext(os.path.basename(path))[0]
+    """Берём номер документа из имени файла dump/N.txt(.gz)."""
+    stem = os.path.splitext(os.path.basename(path).removesuffix(".gz"))[0]
     if not re.fullmatch(r"\d+", stem):
-        raise ValueError(f"Ожидался файл вида N.txt, а получили: {path}")
+        raise ValueError(f"Ожидался файл вида N.txt или N.txt.gz, а получили: {path}")
     return int(stem)
 
 
@@ -74,16 +101,13 @@ def count_terms_in_doc(morph: pymorphy3.MorphAnalyzer, path: str):
       lemma_counts: Counter(lemma -> count)
       total_terms: int  (общее число терминов в документе после всех фильтров)
     """
-    with open(path, "r", encoding="utf-8", errors="replace") as f:
-        html = f.read()
-
-    text = html_to_text(html)
+    # selectolax принимает байты — файл не декодируем отдельно
+    text = html_to_text(read_dump(path))
 
-    raw_freq = Counter()
-    for m in WORD_RE.finditer(text.lower()):
-        tok = normalize_token(m.group(0))
-        if is_clean_token(tok):
-            raw_freq[tok] += 1
+    # normalize_token сам приводит токен к нижнему регистру, а WORD_RE
+    # нечувствителен к регистру — копия всего текста в lower() не нужна
+    normalized = (normalize_token(tok) for tok in WORD_RE.findall(text))
+    raw_freq = Counter(tok for tok in normalized if is_clean_token(tok))
 
     # Итоговые счётчики
     term_counts = Counter()
@@ -151,10 +175,10 @@ def main():
 
     morph = pymorphy3.MorphAnalyzer()
 
-    # Все документы dump/N.txt
-    files = sorted(glob.glob(os.path.join(DUMP_DIR, "*.txt")))
+    # Все документы dump/N.txt.gz (или dump/N.txt)
+    files = list_dump_files(DUMP_DIR)
     if not files:
-        raise SystemExit(f"В папке {DUMP_DIR} нет *.txt файлов")
+        raise SystemExit(f"В папке {DUMP_DIR} нет *.txt.gz / *.txt файлов")
 
     # doc_id -> данные по документу
     doc_term_counts = {}